@@ -28,6 +28,9 @@ setup(
         exclude=['test']
     ),  # Don't include test directory in binary distribution
     install_requires = requirements,
+    extras_require = {
+        'isal': ['isal'],  # Faster decompression of downloaded .zip files
+    },
     entry_points ={
         'console_scripts': [
             'SenSat = sensat.core:main'
@@ -1,20 +1,102 @@
 import argparse
 import datetime
+import hashlib
+import io
 import numpy as np
 import os
+import pandas as pd
+import queue
 import re
 import sentinelsat
+import shutil
+import tempfile
+import time
+import warnings
 import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import repeat
 
+# Optional: ISA-L inflates DEFLATE members considerably faster than the standard zlib
+try:
+    from isal import isal_zlib
+except ImportError:
+    isal_zlib = None
 
 
+# Sentinel-2 tile names are in the format ##XXX (e.g. 36KWA)
+_TILE_RE = re.compile(r"[0-9]{2}[A-Z]{3}\Z")
+
+# Product properties kept from a search; the remaining ~40 OpenSearch properties are never used
+_PRODUCT_COLUMNS = ['uuid', 'title', 'filename', 'size']
+
+
+class _HTTPRangeFile(io.RawIOBase):
+    '''
+    A read-only, seekable file over HTTP, which allows zipfile to read a remote archive without downloading it first.
+    Sequential reads are served from a single streamed response; a new range request is only made after a seek.
+    '''
+
+    def __init__(self, session, url, size):
+        self._session = session
+        self._url = url
+        self._size = size
+        self._pos = 0
+        self._response = None
+        self._response_pos = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET: self._pos = offset
+        elif whence == io.SEEK_CUR: self._pos += offset
+        elif whence == io.SEEK_END: self._pos = self._size + offset
+
+        return self._pos
+
+    def readinto(self, b):
+        if self._pos >= self._size: return 0
+
+        # Skip short gaps (e.g. data descriptors between members) on the open response rather than requesting again
+        if self._response is not None and 0 < self._pos - self._response_pos <= 1 << 16:
+            self._response.raw.read(self._pos - self._response_pos)
+            self._response_pos = self._pos
+
+        if self._response is None or self._response_pos != self._pos:
+            self._close_response()
+            self._response = self._session.get(self._url, headers={'Range': 'bytes=%s-' % self._pos}, stream=True)
+            if self._response.status_code != 206:
+                self._close_response()
+                raise IOError('Server did not honour the range request for %s' % self._url)
+            self._response_pos = self._pos
+
+        n = self._response.raw.readinto(b)
+        self._pos += n
+        self._response_pos += n
+
+        return n
+
+    def close(self):
+        self._close_response()
+        super().close()
+
+    def _close_response(self):
+        if self._response is not None: self._response.close()
+        self._response = None
+
 
 class SenSat:
 
 
 
     def __init__(self, username, password, tiles, level='1C', start='20150523', end=datetime.datetime.today().strftime('%Y%m%d'),
-            maxcloud=100, minsize=25., output_dir=os.getcwd(), remove=False) -> None:
+            maxcloud=100, minsize=25., output_dir=os.getcwd(), remove=False, max_parallel=2, cache_ttl=6.) -> None:
         """
         Download Sentinel-2 data from the Copernicus Open Access Hub, specifying a particular tile, date ranges and degrees
         of cloud cover. This is the function that is initiated from the command line.
@@ -30,32 +112,67 @@ class SenSat:
             minsize: A float with the minimum filesize to download in MB. Defaults to 25 MB.  Be aware, file sizes smaller than this can result sen2three crashing.
             output_dir: Optionally specify an output directory. Defaults to the present working directory.
             remove: Boolean value, which when set to True deletes level 1C .zip files after decompression is complete. Defaults to False.
+            max_parallel: Maximum number of concurrent downloads. Defaults to 2, the number of concurrent flows Scihub allows per user.
+            cache_ttl: Number of hours for which search results cached in output_dir are reused. Defaults to 6 hours. Set to 0 to always query the API.
         """
 
+        if max_parallel < 1: raise ValueError("max_parallel must be at least 1")
+
         # Connect to API
         self._connectToAPI(username, password)
 
         # Allow download of single tile
         if type(tiles) == str: tiles = [tiles]
 
-        for tile in tiles:
+        # Decompress while downloading: this thread searches and downloads tiles, queuing each .zip file as soon as
+        # it completes, while a pool of workers consumes the queue and extracts them. Archives arrive no faster than
+        # they download, so there are as many workers as downloads; their members are all extracted by one shared pool
+        # so that the total number of threads and open files stays bounded.
+        zip_queue = queue.Queue()
+
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as member_pool, \
+                ThreadPoolExecutor(max_workers=max_parallel) as ex:
+            workers = [ex.submit(self._consume, zip_queue, remove, member_pool) for _ in range(max_parallel)]
+
+            try:
+                # Search for files across all tiles, return data frames containing details of matching Sentinel-2 images
+                tile_products = self._search_many(list(dict.fromkeys(tiles)), level=level, start=start, end=end, maxcloud=maxcloud,
+                                                  minsize=minsize, output_dir=output_dir, cache_ttl=cache_ttl)
 
-            # Search for files, return a data frame containing details of matching Sentinel-2 images
-            products = self._search(tile, level=level, start=start, end=end, maxcloud=maxcloud, minsize=minsize)
+                for tile, products in tile_products.items():
 
-            # Where no data
-            if len(products) == 0: continue
+                    # Where no data
+                    if len(products) == 0: continue
 
-            # If folder doesn't exist, then create it.
-            if not os.path.exists('%s/%s' % (output_dir, tile)):
-                os.makedirs('%s/%s' % (output_dir, tile))
+                    tile_dir = os.path.join(output_dir, tile)
 
-            # Download products
-            zip_files = self._download(products, output_dir='%s/%s' % (output_dir, tile))
+                    # If folder doesn't exist, then create it.
+                    os.makedirs(tile_dir, exist_ok=True)
+
+                    # List the tile directory once, rather than testing each .SAFE file separately
+                    extracted = set(os.listdir(tile_dir))
+
+                    # Download products, handing each one over for decompression as it arrives
+                    # Where .zip files would be removed anyway, new products are extracted as they download instead
+                    downloads = self._iter_download(products, output_dir=tile_dir, max_parallel=max_parallel, stream=remove)
+                    try:
+                        for zip_file in downloads:
+
+                            # Workers only return after the sentinel, so one that is done has failed: stop downloading
+                            # and raise its exception now rather than once everything else has downloaded
+                            for worker in workers:
+                                if worker.done(): worker.result()
+
+                            zip_queue.put((zip_file, tile_dir, extracted))
+                    finally:
+                        downloads.close()
+
+            finally:
+                # Signal completion to each decompression worker
+                for _ in workers: zip_queue.put(None)
+
+            for worker in workers: worker.result()
 
-            # Decompress data
-            self._decompress(zip_files, output_dir='%s/%s' % (output_dir, tile), remove=remove)
-        
         return None
 
 
@@ -67,9 +184,10 @@ class SenSat:
             #A Sentinel-2 level 1C .zip file from Copernicus Open Access Data Hub.
         """
 
-        assert '_MSIL1C_' in zip_file, "removeZip function should only be used to delete Sentinel-2 level 1C compressed .SAFE files"
-        assert zip_file.split('/')[-1][
-            -4:] == '.zip', "removeL1C function should only be used to delete Sentinel-2 level 1C compressed .SAFE files"
+        # Checked explicitly rather than with assert, which is stripped under python -O
+        zip_name = os.path.basename(zip_file)
+        if not (zip_name.endswith('.zip') and '_MSIL1C_' in zip_name):
+            raise ValueError("removeZip function should only be used to delete Sentinel-2 level 1C compressed .SAFE files")
 
         os.remove(zip_file)
 
@@ -83,9 +201,7 @@ class SenSat:
         '''
 
         # Tests whether string is in format ##XXX
-        name_test = re.match("[0-9]{2}[A-Z]{3}$", tile)
-
-        return bool(name_test)
+        return _TILE_RE.match(tile) is not None
 
 
     def _connectToAPI(self, username, password):
@@ -114,26 +230,23 @@ class SenSat:
             A numpy array with file sizes in MB.
         """
 
-        size = [int(float(str(i).split(' ')[0])) for i in products_df['size'].values]
-        suffix = [str(i).split(' ')[1].lower() for i in products_df['size'].values]
+        # Sizes already given as a number of bytes need no parsing
+        if pd.api.types.is_numeric_dtype(products_df['size']):
+            return products_df['size'].astype('float64').to_numpy() * 0.000001
 
-        size_mb = []
+        # Split e.g. '812.3 MB' into number and unit, then scale each unit to MB in one pass
+        size = products_df['size'].astype(str).str.split(' ', n=1, expand=True).reindex(columns=[0, 1])
+        number = pd.to_numeric(size[0], errors='coerce').astype('float64').to_numpy()
+        suffix = size[1].astype(object).fillna('mb').str.lower().to_numpy()
 
-        for this_size, this_suffix in zip(size, suffix):
-            if this_suffix == 'kb' or this_suffix == 'kib':
-                size_mb.append(this_size * 0.001)
-            elif this_suffix == 'mb' or this_suffix == 'mib':
-                size_mb.append(this_size * 1.)
-            elif this_suffix == 'gb' or this_suffix == 'gib':
-                size_mb.append(this_size * 1000.)
-            else:
-                size_mb.append(this_size * 0.000001)
+        scale = np.select([np.isin(suffix, ['kb', 'kib']), np.isin(suffix, ['mb', 'mib']), np.isin(suffix, ['gb', 'gib'])],
+                          [0.001, 1., 1000.], default=0.000001)
 
-        return np.array(size_mb)
+        return number * scale
 
 
     def _search(self, tile, level='1C', start='20150523', end=datetime.datetime.today().strftime('%Y%m%d'), maxcloud=100,
-            minsize=25.):
+            minsize=25., output_dir=None, cache_ttl=6.):
         """search(tile, start = '20161206', end = datetime.datetime.today().strftime('%Y%m%d'),  maxcloud = 100, minsize_mb = 25.)
 
         Searches for images from a single Sentinel-2 Granule that meet conditions of date range and cloud cover.
@@ -145,55 +258,207 @@ class SenSat:
             end: End date for search in format YYYYMMDD. Defaults to today's date.
             maxcloud: An integer of maximum percentage of cloud cover to download. Defaults to 100 %% (download all images, regardless of cloud cover).
             minsize: A float with the minimum filesize to download in MB. Defaults to 25 MB.  Be aware, file sizes smaller than this can result sen2three crashing.
+            output_dir: Optionally specify a directory in which to cache search results. Defaults to None (no caching).
+            cache_ttl: Number of hours for which cached search results are reused. Defaults to 6 hours. Set to 0 to always query the API.
 
         Returns:
             A pandas dataframe with details of scenes matching conditions.
         """
 
+        return self._search_many([tile], level=level, start=start, end=end, maxcloud=maxcloud, minsize=minsize,
+                                 output_dir=output_dir, cache_ttl=cache_ttl)[tile]
+
+
+    def _search_many(self, tiles, level='1C', start='20150523', end=datetime.datetime.today().strftime('%Y%m%d'), maxcloud=100,
+            minsize=25., output_dir=None, cache_ttl=6.):
+        """
+        Searches for images from several Sentinel-2 Granules that meet conditions of date range and cloud cover. All tiles
+        that are not already cached are combined into a single query, and the results are split back out by tile.
+
+        Args:
+            tiles: A list of strings containing the names of the tiles to to download.
+            level: Download level '1C' (default) or '2A' data.
+            start: Start date for search in format YYYYMMDD. Defaults to 20150523.
+            end: End date for search in format YYYYMMDD. Defaults to today's date.
+            maxcloud: An integer of maximum percentage of cloud cover to download. Defaults to 100 %% (download all images, regardless of cloud cover).
+            minsize: A float with the minimum filesize to download in MB. Defaults to 25 MB.  Be aware, file sizes smaller than this can result sen2three crashing.
+            output_dir: Optionally specify a directory in which to cache search results. Defaults to None (no caching).
+            cache_ttl: Number of hours for which cached search results are reused. Defaults to 6 hours. Set to 0 to always query the API.
+
+        Returns:
+            A dictionary of pandas dataframes with details of scenes matching conditions, keyed by tile.
+        """
+
         # Test that we're connected to the
         assert 'scihub_api' in globals(), "The global variable scihub_api doesn't exist. You should run connectToAPI(username, password) before searching the data archive."
 
         # Validate tile input format for search
-        assert self._validateTile(tile), "The tile name input (%s) does not match the format ##XXX (e.g. 36KWA)." % tile
+        for tile in tiles:
+            assert self._validateTile(tile), "The tile name input (%s) does not match the format ##XXX (e.g. 36KWA)." % tile
 
         assert level in ['1C', '2A'], "Level must be '1C' or '2A'."
 
-        # Set up start and end dates
-        startdate = sentinelsat.format_query_date(start)
-        enddate = sentinelsat.format_query_date(end)
+        results = {}
+        cache_files = {}
+
+        # Reuse the results of an identical recent search, rather than querying the API again
+        for tile in tiles:
+            cache_files[tile] = None
+            if output_dir is not None and cache_ttl > 0:
+                key = hashlib.sha1(('%s|%s|%s|%s|%s' % (tile, level, start, end, maxcloud)).encode()).hexdigest()
+                cache_files[tile] = os.path.join(output_dir, '.sensat_search_%s.json' % key)
+
+            if cache_files[tile] is not None and os.path.exists(cache_files[tile]) and \
+                    time.time() - os.path.getmtime(cache_files[tile]) < cache_ttl * 3600.:
+
+                # An unreadable cache file (e.g. from an older version) is treated as a cache miss
+                try:
+                    products_df = pd.read_json(cache_files[tile], orient='split', dtype=False, convert_dates=False)
+                    results[tile] = products_df[_PRODUCT_COLUMNS]
+                except Exception:
+                    pass
+
+        to_query = [tile for tile in cache_files if tile not in results]
+
+        if len(to_query) > 0:
+            # Set up start and end dates
+            startdate = sentinelsat.format_query_date(start)
+            enddate = sentinelsat.format_query_date(end)
+
+            # Search data, filtering by options. A set of filenames is combined into one OR query.
+            products = self._query(beginposition=(startdate, enddate),
+                                   platformname='Sentinel-2',
+                                   producttype='S2MSI%s' % level,
+                                   cloudcoverpercentage=(0, maxcloud),
+                                   filename={'*T%s*' % tile for tile in to_query})
+
+            # convert to Pandas DataFrame, which can be searched modified before commiting to download(). Only the
+            # fields used downstream are taken, rather than building every one of the ~40 product properties.
+            products_df = pd.DataFrame.from_records(
+                [(uuid, props.get('title'), props.get('filename'), props.get('size')) for uuid, props in products.items()],
+                index=list(products), columns=_PRODUCT_COLUMNS)
+
+            # Split results back out by the tile named in each filename, grouping in one pass rather than masking the
+            # whole frame once per tile
+            product_tiles = products_df['filename'].str.extract(r'_T([0-9]{2}[A-Z]{3})_', expand=False)
+            groups = dict(tuple(products_df.groupby(product_tiles))) if len(products_df) > 0 else {}
+
+            for tile in to_query:
+                results[tile] = groups.get(tile, products_df.iloc[:0])
+
+                if cache_files[tile] is not None:
+                    os.makedirs(output_dir, exist_ok=True)
+
+                    # Write to a temporary file first, so that an interrupted run never leaves a partial cache file
+                    fd, tmp_file = tempfile.mkstemp(dir=output_dir, prefix='.sensat_search_', suffix='.tmp')
+                    try:
+                        with os.fdopen(fd, 'w') as f:
+                            results[tile].to_json(f, orient='split')
+                        os.replace(tmp_file, cache_files[tile])
+                    except BaseException:
+                        os.remove(tmp_file)
+                        raise
 
-        # Search data, filtering by options.
-        products = scihub_api.query(beginposition=(startdate, enddate),
-                                    platformname='Sentinel-2',
-                                    producttype='S2MSI%s' % level,
-                                    cloudcoverpercentage=(0, maxcloud),
-                                    filename='*T%s*' % tile)
+            if output_dir is not None and cache_ttl > 0: self._prune_cache(output_dir, cache_ttl)
 
-        # convert to Pandas DataFrame, which can be searched modified before commiting to download()
-        products_df = scihub_api.to_dataframe(products)
+        # Return results in the order the tiles were requested
+        results = {tile: results[tile] for tile in cache_files}
 
-        # print('Found %s matching images' % str(len(products_df)))
+        for tile, products_df in results.items():
 
-        # Where no results for tile
-        if len(products_df) == 0: return products_df
+            # Where no results for tile
+            if len(products_df) == 0: continue
 
-        products_df['filesize_mb'] = self._get_filesize(products_df)
+            products_df = products_df.assign(filesize_mb=self._get_filesize(products_df))
 
-        products_df = products_df[products_df['filesize_mb'] >= float(minsize)]
+            results[tile] = products_df[products_df['filesize_mb'] >= float(minsize)]
 
-        print('Found %s matching images for tile: %s' % (str(len(products_df)), tile))
+            print('Found %s matching images for tile: %s' % (str(len(results[tile])), tile))
 
-        return products_df
+        return results
 
 
-    def _download(self, products_df, output_dir=os.getcwd()):
-        ''' download(products_df, output_dir = os.getcwd())
+    def _prune_cache(self, output_dir, cache_ttl=6.):
+        """
+        Deletes cached search results that have expired. Cache keys include the end date, which defaults to today, so
+        without pruning a new file would be left behind every day.
+
+        Args:
+            output_dir: The directory in which search results are cached.
+            cache_ttl: Number of hours for which cached search results are reused. Defaults to 6 hours.
+        """
+
+        for name in os.listdir(output_dir):
+            if not name.startswith('.sensat_search_'): continue
+
+            cache_file = os.path.join(output_dir, name)
+
+            # Another process may be pruning the same directory
+            try:
+                if time.time() - os.path.getmtime(cache_file) >= cache_ttl * 3600.: os.remove(cache_file)
+            except FileNotFoundError:
+                pass
+
+
+    def _query(self, **keywords):
+        """
+        Queries the Scihub API, fetching pages of results concurrently rather than one after another.
+
+        Args:
+            **keywords: Search keywords, as accepted by sentinelsat.SentinelAPI.query().
+
+        Returns:
+            An OrderedDict of matching products, as returned by sentinelsat.SentinelAPI.query().
+        """
+
+        page_size = scihub_api.page_size
+
+        # Pages must come from a stable ordering so that they neither overlap nor leave gaps
+        page = lambda offset: scihub_api.query(order_by='+beginposition', limit=page_size, offset=offset, **keywords)
+
+        # A first page that isn't full holds every result, so most searches take a single request
+        products = page(0)
+        if len(products) < page_size: return products
+
+        # Otherwise learn the number of results, so that every remaining page can be requested at once. Sentinelsat
+        # lets no more than concurrent_dl_limit requests through at a time, so a larger pool would only queue.
+        count = scihub_api.count(**keywords)
+        offsets = range(page_size, count, page_size)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(len(offsets), getattr(scihub_api, 'concurrent_dl_limit', 4)))) as ex:
+            for products_page in ex.map(page, offsets): products.update(products_page)
+
+        # Where the archive changed between page requests, fall back to a single serial query
+        if len(products) != count: products = scihub_api.query(**keywords)
+
+        return products
+
+
+    def _download(self, products_df, output_dir=os.getcwd(), max_parallel=2):
+        ''' download(products_df, output_dir = os.getcwd(), max_parallel = 2)
 
         Downloads all images from a dataframe produced by sentinelsat.
 
         Args:
             products_df: Pandas dataframe from search() function.
             output_dir: Optionally specify an output directory. Defaults to the present working directory.
+            max_parallel: Maximum number of concurrent downloads. Defaults to 2, the number of concurrent flows Scihub allows per user.
+        '''
+
+        return list(self._iter_download(products_df, output_dir=output_dir, max_parallel=max_parallel))
+
+
+    def _iter_download(self, products_df, output_dir=os.getcwd(), max_parallel=2, stream=False):
+        '''
+        Downloads all images from a dataframe produced by sentinelsat, yielding the path of each .zip file as soon as it
+        is available.
+
+        Args:
+            products_df: Pandas dataframe from search() function.
+            output_dir: Optionally specify an output directory. Defaults to the present working directory.
+            max_parallel: Maximum number of concurrent downloads. Defaults to 2, the number of concurrent flows Scihub allows per user.
+            stream: Boolean value, which when set to True extracts new products as they download, without keeping a .zip
+                file. Products that cannot be streamed are downloaded as .zip files instead. Defaults to False.
         '''
 
         assert os.path.isdir(output_dir), "Output directory doesn't exist."
@@ -202,34 +467,110 @@ class SenSat:
             print ('WARNING: No products found to download. Check your search terms.')
             raise
 
-        else:
+        to_download = []
+
+        # List the output directory once, rather than testing each product's files separately
+        existing = set(os.listdir(output_dir))
+        prefix = os.path.normpath(output_dir) + os.sep
 
-            downloaded_files = []
+        # Iterate plain Python lists rather than boxing each value through the Series iterator
+        for uuid, filename in zip(products_df['uuid'].tolist(), products_df['filename'].tolist()):
 
-            for uuid, filename in zip(products_df['uuid'], products_df['filename']):
+            if filename[:-5] + '.zip' in existing:
+                print ('Skipping file %s, as it has already been downloaded in the directory %s. If you want to re-download it, delete it and run again.' % (
+                filename, output_dir))
 
-                if os.path.exists('%s/%s' % (output_dir, filename[:-5] + '.zip')):
-                    print ('Skipping file %s, as it has already been downloaded in the directory %s. If you want to re-download it, delete it and run again.' % (
-                    filename, output_dir))
+                yield prefix + filename[:-5] + '.zip'
 
-                    downloaded_files.append(('%s/%s' % (output_dir.rstrip('/'), filename)).replace('.SAFE', '.zip'))
+            elif filename in existing:
+                print ('Skipping file %s, as it has already been downloaded and extracted in the directory %s. If you want to re-download it, delete it and run again.' % (
+                filename, output_dir))
 
-                elif os.path.exists('%s/%s' % (output_dir, filename)):
-                    print ('Skipping file %s, as it has already been downloaded and extracted in the directory %s. If you want to re-download it, delete it and run again.' % (
-                    filename, output_dir))
+            else:
+                to_download.append((uuid, filename))
 
-                else:
+        fetch = self._download_and_extract_one if stream else self._download_one
 
-                    try:
-                        # Download selected product
-                        print ('Downloading %s...' % filename)
-                        scihub_api.download(uuid, output_dir)
+        # Download remaining products concurrently
+        ex = ThreadPoolExecutor(max_workers=max_parallel)
+        try:
+            futures = [ex.submit(fetch, uuid, filename, output_dir) for uuid, filename in to_download]
+            for future in as_completed(futures):
+                zip_file = future.result()
+                if zip_file: yield zip_file
+        finally:
+            # Don't start queued downloads if the caller stops early or a download fails
+            ex.shutdown(wait=True, cancel_futures=True)
+
+
+    def _download_and_extract_one(self, uuid, filename, output_dir=os.getcwd()):
+        '''
+        Downloads a single image from Scihub, extracting it directly from the network rather than writing the .zip file
+        to disk first. Where the product cannot be streamed (e.g. it is offline in the long term archive), it is
+        downloaded as a .zip file instead.
+
+        Args:
+            uuid: The Scihub uuid of the product to download.
+            filename: The .SAFE filename of the product.
+            output_dir: Optionally specify an output directory. Defaults to the present working directory.
+        Returns:
+            None where the product was extracted (or skipped for lack of disk space), otherwise the path of the
+            downloaded .zip file (or None where the download failed).
+        '''
+
+        try:
+            # Offline products must be requested from the long term archive through a regular download
+            product_info = scihub_api.get_product_odata(uuid)
+            if not product_info.get('Online', True): return self._download_one(uuid, filename, output_dir)
+
+            print ('Downloading and extracting %s...' % filename)
+
+            # Read the archive through HTTP range requests, buffered in 1 MiB blocks
+            remote = io.BufferedReader(_HTTPRangeFile(scihub_api.session, product_info['url'], product_info['size']),
+                                       buffer_size=1 << 20)
+
+            with zipfile.ZipFile(remote) as obj:
+                members = obj.infolist()
+
+                # A regular download would need even more space, so skip the product rather than falling back
+                if not self._has_disk_space(filename, members, output_dir): return None
+
+                # Extract into a temporary directory and only move the .SAFE into place once every member has been
+                # read (and so had its CRC checked), so an interrupted run never leaves a partial product to be skipped
+                tmp_dir = tempfile.mkdtemp(dir=output_dir, prefix='.sensat_extract_')
+                try:
+                    for info in members:
+                        self._extract_member(obj, info, tmp_dir)
+                    os.replace(os.path.join(tmp_dir, filename), os.path.join(output_dir, filename))
+                finally:
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+            return None
+
+        except Exception:
+            return self._download_one(uuid, filename, output_dir)
+
+
+    def _download_one(self, uuid, filename, output_dir=os.getcwd()):
+        '''
+        Downloads a single image from Scihub.
 
-                        downloaded_files.append(('%s/%s' % (output_dir.rstrip('/'), filename)).replace('.SAFE', '.zip'))
-                    except:
-                        continue
+        Args:
+            uuid: The Scihub uuid of the product to download.
+            filename: The .SAFE filename of the product.
+            output_dir: Optionally specify an output directory. Defaults to the present working directory.
+        Returns:
+            The path of the downloaded .zip file, or None where the download failed.
+        '''
+
+        try:
+            # Download selected product
+            print ('Downloading %s...' % filename)
+            scihub_api.download(uuid, output_dir)
 
-        return downloaded_files
+            return os.path.join(output_dir, filename[:-5] + '.zip')
+        except:
+            return None
 
 
     def _decompress(self, zip_files, output_dir=os.getcwd(), remove=False):
@@ -245,29 +586,172 @@ class SenSat:
 
         if type(zip_files) == str: zip_files = [zip_files]
 
-        for zip_file in zip_files:
-            assert zip_file[-4:] == '.zip', "Files to decompress must be .zip format."
+        # Files to decompress must be .zip format
+        n_files = len(zip_files)
+        zip_files = [zip_file for zip_file in zip_files if zip_file.endswith('.zip')]
+        if len(zip_files) != n_files:
+            warnings.warn('Skipping %s file(s) that are not in .zip format.' % (n_files - len(zip_files)))
+
+        if len(zip_files) == 0: return
 
-        # Decompress each zip file
-        for zip_file in zip_files:
+        # List the output directory once, rather than testing each .SAFE file separately
+        extracted = set(os.listdir(output_dir)) if os.path.isdir(output_dir) else set()
 
-            # Skip those files that have already been extracted
-            if os.path.exists('%s/%s' % (output_dir, zip_file.split('/')[-1].replace('.zip', '.SAFE'))):
-                print ('Skipping extraction of %s, as it has already been extracted in directory %s. If you want to re-extract it, delete the .SAFE file.' % (
-                zip_file, output_dir))
+        # Decompress zip files in parallel, one task per archive, with the members of all archives extracted by one
+        # shared pool
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as member_pool, \
+                ThreadPoolExecutor(max_workers=min(len(zip_files), os.cpu_count() or 1)) as ex:
+            list(ex.map(self._extract_one, zip_files, repeat(output_dir), repeat(remove), repeat(extracted), repeat(member_pool)))
 
+
+    def _extract_one(self, zip_file, output_dir=os.getcwd(), remove=False, extracted=None, pool=None):
+        '''
+        Decompresses a single .zip file downloaded from SciHub, and optionally removes the original .zip file.
+
+        Args:
+            zip_file: A .zip file to decompress.
+            output_dir: Optionally specify an output directory. Defaults to the present working directory.
+            remove: Boolean value, which when set to True deletes level 1C .zip files after decompression is complete. Defaults to False.
+            extracted: Optionally, a set of the names already present in output_dir. Where not given, the directory is checked directly.
+            pool: Optionally, a shared concurrent.futures executor in which to extract members. Where not given, a pool is
+                created for this archive alone.
+        '''
+
+        safe_file = os.path.basename(zip_file)[:-4] + '.SAFE'
+        if extracted is None: extracted = {safe_file} if os.path.exists(os.path.join(output_dir, safe_file)) else set()
+
+        # Skip those files that have already been extracted
+        if safe_file in extracted:
+            print ('Skipping extraction of %s, as it has already been extracted in directory %s. If you want to re-extract it, delete the .SAFE file.' % (
+            zip_file, output_dir))
+
+        else:
+            print ('Extracting %s' % zip_file)
+            # Open the archive directly rather than checking it with is_zipfile first, which would parse it twice
+            try:
+                with zipfile.ZipFile(zip_file) as obj:
+                    members = obj.infolist()
+            except zipfile.BadZipFile:
+                print('********** Could not extract the zip file: %s' % zip_file)
+                print('********** Try to remove bad the zip file: %s' % zip_file)
+                self._removeZip(zip_file)
+                return
+
+            if not self._has_disk_space(zip_file, members, output_dir): return
+
+            # Extract members in parallel, each task reading through its own ZipFile handle
+            n_shards = max(1, min(len(members), os.cpu_count() or 1))
+            shards = [members[i::n_shards] for i in range(n_shards)]
+            if pool is None:
+                with ThreadPoolExecutor(max_workers=n_shards) as ex:
+                    list(ex.map(self._extract_members, repeat(zip_file), shards, repeat(output_dir)))
             else:
-                print ('Extracting %s' % zip_file)
-                if zipfile.is_zipfile(zip_file):
-                    with zipfile.ZipFile(zip_file) as obj:
-                        obj.extractall(output_dir)
-                else:
-                    print('********** Could not extract the zip file: %s' % zip_file)
-                    print('********** Try to remove bad the zip file: %s' % zip_file)
-                    self._removeZip(zip_file)
+                list(pool.map(self._extract_members, repeat(zip_file), shards, repeat(output_dir)))
+
+            # Delete zip file
+            if remove: self._removeZip(zip_file)
+
+
+    def _has_disk_space(self, zip_file, members, output_dir=os.getcwd()):
+        '''
+        Checks that the members of a .zip file will fit on disk once extracted. Members are streamed straight to disk,
+        so this is checked up front rather than filling the disk part way through.
+
+        Args:
+            zip_file: The .zip file (or URL) the members belong to, for reporting.
+            members: A list of ZipInfo objects to be extracted.
+            output_dir: Optionally specify an output directory. Defaults to the present working directory.
+        Returns:
+            True where there is enough free space in output_dir, otherwise False.
+        '''
+
+        required_mb = sum(info.file_size for info in members) * 0.000001
+        free_mb = shutil.disk_usage(output_dir).free * 0.000001
+        if required_mb > free_mb:
+            print('********** Not enough disk space to extract %s (%.1f MB required, %.1f MB free)' % (
+            zip_file, required_mb, free_mb))
+            return False
+
+        return True
+
+
+    def _consume(self, zip_queue, remove=False, pool=None):
+        '''
+        Decompresses (zip_file, output_dir, extracted) items taken from a queue until a None sentinel is received.
+
+        Args:
+            zip_queue: A queue.Queue of (zip_file, output_dir, extracted) tuples, terminated by None.
+            remove: Boolean value, which when set to True deletes level 1C .zip files after decompression is complete. Defaults to False.
+            pool: Optionally, a shared concurrent.futures executor in which to extract members.
+        '''
+
+        while True:
+            item = zip_queue.get()
+            if item is None: return
+
+            zip_file, output_dir, extracted = item
+            self._extract_one(zip_file, output_dir=output_dir, remove=remove, extracted=extracted, pool=pool)
+
+
+    def _extract_members(self, zip_file, members, output_dir=os.getcwd()):
+        '''
+        Extracts a subset of the members of a .zip file. Each call opens its own handle on the archive, as ZipFile
+        objects cannot be shared between threads.
+
+        Args:
+            zip_file: A .zip file to decompress.
+            members: A list of ZipInfo objects to extract from zip_file.
+            output_dir: Optionally specify an output directory. Defaults to the present working directory.
+        '''
+
+        with zipfile.ZipFile(zip_file) as obj:
+            for info in members:
+                self._extract_member(obj, info, output_dir)
+
+
+    def _extract_member(self, obj, info, output_dir=os.getcwd()):
+        '''
+        Extracts a single member of an open .zip file.
+
+        Args:
+            obj: An open zipfile.ZipFile.
+            info: The ZipInfo object of the member to extract.
+            output_dir: Optionally specify an output directory. Defaults to the present working directory.
+        '''
+
+        root = os.path.abspath(output_dir)
+
+        # Refuse members that would be written outside of the output directory
+        target = os.path.abspath(os.path.join(root, info.filename))
+        if os.path.commonpath([root, target]) != root: return
+
+        if info.is_dir():
+            os.makedirs(target, exist_ok=True)
+            return
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+
+        # Copy with a 1 MiB buffer rather than the 16 KiB default to cut down on read/write calls
+        with obj.open(info) as src, open(target, 'wb') as dst:
+
+            # Swap in the ISA-L decompressor where available, its decompressobj is a drop-in for zlib's. This replaces a
+            # private attribute of ZipExtFile, so it is only done where that attribute exists; the CRC is still checked
+            # by zipfile either way.
+            if isal_zlib is not None and info.compress_type == zipfile.ZIP_DEFLATED and hasattr(src, '_decompressor'):
+                src._decompressor = isal_zlib.decompressobj(-15)
+
+            shutil.copyfileobj(src, dst, length=1 << 20)
+
+
+def _positive_int(value):
+    '''
+    Argument type for options that take an integer of at least 1.
+    '''
+
+    n = int(value)
+    if n < 1: raise argparse.ArgumentTypeError("must be at least 1, got %s" % value)
 
-                # Delete zip file
-                if remove: self._removeZip(zip_file)
+    return n
 
 
 def main():
@@ -289,8 +773,10 @@ def main():
     parser.add_argument("-m", "--minsize", type=float, default=25.0, help="Minimum filesize to download in MB. Defaults to 25.0 MB")
     parser.add_argument("-d", "--output-dir", type=str, default=os.getcwd(), help="Output directory. Defaults to the present working directory")
     parser.add_argument("-r", "--remove", action="store_true", help="Delete level 1C .zip files after decompression is complete")
+    parser.add_argument("-j", "--max-parallel", type=_positive_int, default=2, help="Maximum number of concurrent downloads. Defaults to 2")
+    parser.add_argument("--cache-ttl", type=float, default=6.0, help="Hours for which cached search results are reused. Set to 0 to disable. Defaults to 6")
 
     args = parser.parse_args()
 
     obj = SenSat(args.username, args.password, args.tiles, args.level, args.start, args.end, 
-        args.maxcloud, args.minsize, args.output_dir, args.remove)
\ No newline at end of file
+        args.maxcloud, args.minsize, args.output_dir, args.remove, args.max_parallel, args.cache_ttl)
\ No newline at end of file
@@ -0,0 +1,94 @@
+import collections
+import glob
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import sensat.core as core
+from sensat.core import SenSat
+
+
+TILE = '39STD'
+
+
+def _products():
+    '''
+    Builds a search result in the format returned by sentinelsat.SentinelAPI.query().
+    '''
+
+    products = collections.OrderedDict()
+    for i in range(3):
+        title = 'S2A_MSIL1C_2020010%dT070251_N0208_R120_T%s_20200101T085043' % (i + 1, TILE)
+        products['uuid-%d' % i] = {'title': title, 'filename': title + '.SAFE', 'size': '%d MB' % (700 + i)}
+
+    return products
+
+
+class CacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(core, 'scihub_api', object(), create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+
+        self.sensat = SenSat.__new__(SenSat)
+        self.sensat._query = mock.Mock(side_effect=lambda **keywords: _products())
+
+    def _search(self):
+        return self.sensat._search_many([TILE], start='20200101', end='20200201', output_dir=self.output_dir, cache_ttl=1.)[TILE]
+
+    def _cache_files(self):
+        return glob.glob(os.path.join(self.output_dir, '.sensat_search_*.json'))
+
+    def test_recent_search_is_reused(self):
+        first = self._search()
+        second = self._search()
+
+        self.assertEqual(self.sensat._query.call_count, 1)
+        self.assertEqual(len(self._cache_files()), 1)
+        self.assertEqual(list(second['filename']), list(first['filename']))
+        self.assertEqual(list(second['filesize_mb']), [700., 701., 702.])
+
+    def test_expired_search_is_repeated_and_pruned(self):
+        self._search()
+        cache_file, = self._cache_files()
+
+        # A cache file left behind by a search with another end date
+        stale_file = os.path.join(self.output_dir, '.sensat_search_stale.json')
+        open(stale_file, 'w').close()
+
+        expired = time.time() - 2 * 3600.
+        os.utime(cache_file, (expired, expired))
+        os.utime(stale_file, (expired, expired))
+
+        self._search()
+
+        self.assertEqual(self.sensat._query.call_count, 2)
+        self.assertEqual(self._cache_files(), [cache_file])
+        self.assertGreater(os.path.getmtime(cache_file), expired)
+
+    def test_corrupt_cache_is_a_miss(self):
+        self._search()
+        cache_file, = self._cache_files()
+
+        with open(cache_file, 'w') as f:
+            f.write('{"columns": ["uuid"')
+
+        products_df = self._search()
+
+        self.assertEqual(self.sensat._query.call_count, 2)
+        self.assertEqual(len(products_df), 3)
+
+        # The corrupt file is replaced, so the next search is a hit again
+        self._search()
+        self.assertEqual(self.sensat._query.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
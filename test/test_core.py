@@ -0,0 +1,209 @@
+import collections
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+import zlib
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import sensat.core as core
+from sensat.core import SenSat
+
+
+class _FakeSearchAPI:
+    '''
+    Serves a fixed list of products through the paging interface of sentinelsat.SentinelAPI.
+    '''
+
+    page_size = 100
+    concurrent_dl_limit = 4
+
+    def __init__(self, n_products):
+        self.products = collections.OrderedDict(('uuid-%04d' % i, {'title': 'product %d' % i}) for i in range(n_products))
+        self.calls = []
+
+    def count(self, **keywords):
+        self.calls.append('count')
+        return len(self.products)
+
+    def query(self, order_by=None, limit=None, offset=0, **keywords):
+        self.calls.append(('query', offset))
+        self.keywords = keywords
+        items = list(self.products.items())[offset:]
+        return collections.OrderedDict(items if limit is None else items[:limit])
+
+
+class FilesizeTestCase(unittest.TestCase):
+
+    def _get_filesize(self, sizes):
+        return SenSat.__new__(SenSat)._get_filesize(pd.DataFrame({'size': sizes}))
+
+    def test_units_are_scaled_to_mb(self):
+        np.testing.assert_allclose(self._get_filesize(['1.07 GB', '812.3 MB', '512 KB', '2.5 GiB']),
+                                   [1070., 812.3, 0.512, 2500.])
+
+    def test_sizes_are_not_truncated(self):
+        np.testing.assert_allclose(self._get_filesize(['1.99 GB', '25.9 MB']), [1990., 25.9])
+
+    def test_missing_unit_defaults_to_mb(self):
+        np.testing.assert_allclose(self._get_filesize(['700', '1.5 GB']), [700., 1500.])
+        np.testing.assert_allclose(self._get_filesize(['700', '25']), [700., 25.])
+
+    def test_numeric_sizes_are_bytes(self):
+        np.testing.assert_allclose(self._get_filesize([1070000000, 25000000]), [1070., 25.])
+
+    def test_unparseable_size_is_nan(self):
+        filesize = self._get_filesize([None, '812.3 MB'])
+
+        self.assertTrue(np.isnan(filesize[0]))
+        self.assertAlmostEqual(filesize[1], 812.3)
+
+
+class RemoveZipTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+
+    def _touch(self, name):
+        path = os.path.join(self.output_dir, name)
+        open(path, 'wb').close()
+        return path
+
+    def test_removes_level_1c_zip(self):
+        zip_file = self._touch('S2A_MSIL1C_20200101T070251_N0208_R120_T39STD_20200101T085043.zip')
+
+        SenSat.__new__(SenSat)._removeZip(zip_file)
+
+        self.assertFalse(os.path.exists(zip_file))
+
+    def test_refuses_other_files(self):
+        for name in ['S2A_MSIL2A_20200101T070251_N0208_R120_T39STD_20200101T085043.zip',
+                     'S2A_MSIL1C_20200101T070251_N0208_R120_T39STD_20200101T085043.SAFE']:
+            path = self._touch(name)
+
+            with self.assertRaises(ValueError):
+                SenSat.__new__(SenSat)._removeZip(path)
+
+            self.assertTrue(os.path.exists(path))
+
+    def test_decompress_skips_files_that_are_not_zip(self):
+        with self.assertWarns(UserWarning):
+            SenSat.__new__(SenSat)._decompress([self._touch('notes.txt')], output_dir=self.output_dir)
+
+
+class QueryTestCase(unittest.TestCase):
+
+    def _query(self, n_products):
+        self.api = _FakeSearchAPI(n_products)
+
+        with mock.patch.object(core, 'scihub_api', self.api, create=True):
+            return SenSat.__new__(SenSat)._query(platformname='Sentinel-2')
+
+    def test_single_page_takes_one_request(self):
+        products = self._query(42)
+
+        self.assertEqual(list(products), list(self.api.products))
+        self.assertEqual(self.api.calls, [('query', 0)])
+
+    def test_full_first_page_fetches_remaining_pages(self):
+        products = self._query(250)
+
+        self.assertEqual(list(products), list(self.api.products))
+        self.assertEqual(self.api.calls[:2], [('query', 0), 'count'])
+        self.assertEqual(sorted(self.api.calls[2:]), [('query', 100), ('query', 200)])
+
+    def test_exactly_one_full_page(self):
+        products = self._query(100)
+
+        self.assertEqual(list(products), list(self.api.products))
+        self.assertEqual(self.api.calls, [('query', 0), 'count'])
+
+
+class ExtractMemberTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.payload = b''.join(b'<band>%d</band>' % i for i in range(20000))
+
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as zf:
+            zf.writestr('product.SAFE/MTD.xml', self.payload, compress_type=zipfile.ZIP_DEFLATED)
+        self.data = buffer.getvalue()
+
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+
+    def _extract(self, data):
+        with zipfile.ZipFile(io.BytesIO(data)) as obj:
+            SenSat.__new__(SenSat)._extract_member(obj, obj.getinfo('product.SAFE/MTD.xml'), self.output_dir)
+
+        with open(os.path.join(self.output_dir, 'product.SAFE', 'MTD.xml'), 'rb') as f:
+            return f.read()
+
+    def test_extracts_with_isal(self):
+        # zlib stands in where isal is not installed, as its decompressobj is the same interface
+        isal_zlib = mock.Mock(wraps=core.isal_zlib or zlib)
+
+        with mock.patch.object(core, 'isal_zlib', isal_zlib):
+            self.assertEqual(self._extract(self.data), self.payload)
+
+        isal_zlib.decompressobj.assert_called_once_with(-15)
+
+    def test_extracts_without_isal(self):
+        with mock.patch.object(core, 'isal_zlib', None):
+            self.assertEqual(self._extract(self.data), self.payload)
+
+    def test_crc_is_checked_with_isal(self):
+        with zipfile.ZipFile(io.BytesIO(self.data)) as obj:
+            info = obj.getinfo('product.SAFE/MTD.xml')
+            info.CRC ^= 0xffffffff
+
+            with mock.patch.object(core, 'isal_zlib', core.isal_zlib or zlib), self.assertRaises(zipfile.BadZipFile):
+                SenSat.__new__(SenSat)._extract_member(obj, info, self.output_dir)
+
+
+class SearchManyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.api = _FakeSearchAPI(0)
+
+        patcher = mock.patch.object(core, 'scihub_api', self.api, create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _add_product(self, tile, size, date='20200101'):
+        title = 'S2A_MSIL1C_%sT070251_N0208_R120_T%s_%sT085043' % (date, tile, date)
+        self.api.products['uuid-%d' % len(self.api.products)] = {'title': title, 'filename': title + '.SAFE', 'size': size}
+
+    def test_unparseable_size_is_dropped(self):
+        self._add_product('39STD', '812.3 MB')
+        self._add_product('39STD', None, date='20200102')
+
+        products_df = SenSat.__new__(SenSat)._search_many(['39STD'])['39STD']
+
+        self.assertEqual(list(products_df['filesize_mb']), [812.3])
+
+    def test_results_are_split_by_tile(self):
+        self._add_product('39STD', '812.3 MB')
+        self._add_product('39STC', '1.07 GB')
+        self._add_product('39STD', '790 MB', date='20200102')
+
+        results = SenSat.__new__(SenSat)._search_many(['39STC', '39STD', '38SQJ'])
+
+        # One query covers every tile, and results come back in the order the tiles were requested
+        self.assertEqual(self.api.calls, [('query', 0)])
+        self.assertEqual(self.api.keywords['filename'], {'*T39STC*', '*T39STD*', '*T38SQJ*'})
+        self.assertEqual(list(results), ['39STC', '39STD', '38SQJ'])
+
+        self.assertEqual(list(results['39STC']['filesize_mb']), [1070.])
+        self.assertEqual(list(results['39STD']['filesize_mb']), [812.3, 790.])
+        self.assertEqual(len(results['38SQJ']), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,205 @@
+import io
+import os
+import re
+import shutil
+import tempfile
+import threading
+import unittest
+import zipfile
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import requests
+
+import sensat.core as core
+from sensat.core import SenSat, _HTTPRangeFile
+
+
+SAFE_NAME = 'S2A_MSIL1C_20200101T070251_N0208_R120_T39STD_20200101T085043.SAFE'
+
+
+def _make_archive():
+    '''
+    Builds a small Sentinel-2 style .zip in memory, mixing stored (JP2) and deflated (XML) members.
+    '''
+
+    buffer = io.BytesIO()
+    payload = os.urandom(200000)
+
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        zf.writestr(SAFE_NAME + '/', '')
+        for i in range(10):
+            zf.writestr('%s/GRANULE/IMG_DATA/B%02d.jp2' % (SAFE_NAME, i), payload[i:], compress_type=zipfile.ZIP_STORED)
+            zf.writestr('%s/GRANULE/MTD_%02d.xml' % (SAFE_NAME, i), ('<band>%d</band>' % i) * 2000,
+                        compress_type=zipfile.ZIP_DEFLATED)
+
+    return buffer.getvalue()
+
+
+class _RangeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        match = re.match(r'bytes=(\d+)-', self.headers.get('Range', ''))
+        server.requests.append(self.headers.get('Range'))
+
+        if server.honour_range and match:
+            start = int(match.group(1))
+            body = server.data[start:]
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, len(server.data) - 1, len(server.data)))
+        else:
+            body = server.data
+            self.send_response(200)
+
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class _RangeServer(ThreadingHTTPServer):
+
+    def handle_error(self, request, client_address):
+        # Clients drop streamed responses early whenever they seek; that is expected here
+        pass
+
+
+class _FakeAPI:
+    def __init__(self, url, data):
+        self.session = requests.Session()
+        self._url = url
+        self._data = data
+        self.downloads = []
+
+    def get_product_odata(self, uuid):
+        return {'url': self._url, 'size': len(self._data), 'Online': True}
+
+    def download(self, uuid, directory_path):
+        self.downloads.append(uuid)
+        with open(os.path.join(directory_path, SAFE_NAME[:-5] + '.zip'), 'wb') as f:
+            f.write(self._data)
+
+
+class StreamTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.data = _make_archive()
+
+        self.server = _RangeServer(('127.0.0.1', 0), _RangeHandler)
+        self.server.data = self.data
+        self.server.requests = []
+        self.server.honour_range = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.url = 'http://127.0.0.1:%s/product' % self.server.server_port
+        self.api = _FakeAPI(self.url, self.data)
+
+        patcher = mock.patch.object(core, 'scihub_api', self.api, create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+
+        self.sensat = SenSat.__new__(SenSat)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_extracted_tree_matches_extractall(self):
+        result = self.sensat._download_and_extract_one('uuid', SAFE_NAME, self.output_dir)
+
+        self.assertIsNone(result)
+        self.assertEqual(self.api.downloads, [])
+
+        reference_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, reference_dir)
+        with zipfile.ZipFile(io.BytesIO(self.data)) as zf:
+            zf.extractall(reference_dir)
+
+        for dirpath, dirnames, filenames in os.walk(reference_dir):
+            relative = os.path.relpath(dirpath, reference_dir)
+            self.assertEqual(sorted(os.listdir(os.path.join(self.output_dir, relative))), sorted(dirnames + filenames))
+            for filename in filenames:
+                with open(os.path.join(dirpath, filename), 'rb') as expected, \
+                        open(os.path.join(self.output_dir, relative, filename), 'rb') as actual:
+                    self.assertEqual(actual.read(), expected.read())
+
+    def test_falls_back_when_range_is_ignored(self):
+        self.server.honour_range = False
+
+        result = self.sensat._download_and_extract_one('uuid', SAFE_NAME, self.output_dir)
+
+        self.assertEqual(result, os.path.join(self.output_dir, SAFE_NAME[:-5] + '.zip'))
+        self.assertEqual(self.api.downloads, ['uuid'])
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, SAFE_NAME)))
+
+    def test_skips_without_fallback_when_disk_is_full(self):
+        usage = namedtuple('usage', 'total used free')(0, 0, 0)
+
+        with mock.patch.object(core.shutil, 'disk_usage', return_value=usage):
+            result = self.sensat._download_and_extract_one('uuid', SAFE_NAME, self.output_dir)
+
+        self.assertIsNone(result)
+        self.assertEqual(self.api.downloads, [])
+        self.assertEqual(os.listdir(self.output_dir), [])
+
+    def test_interrupted_extraction_leaves_no_product(self):
+        extract_member = SenSat._extract_member
+        calls = []
+
+        def interrupt(self, obj, info, output_dir):
+            calls.append(info.filename)
+            if len(calls) == 5: raise KeyboardInterrupt
+            return extract_member(self, obj, info, output_dir)
+
+        with mock.patch.object(SenSat, '_extract_member', interrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                self.sensat._download_and_extract_one('uuid', SAFE_NAME, self.output_dir)
+
+        self.assertEqual(len(calls), 5)
+        self.assertEqual(self.api.downloads, [])
+        self.assertEqual(os.listdir(self.output_dir), [])
+
+    def test_short_forward_seek_reuses_response(self):
+        remote = _HTTPRangeFile(self.api.session, self.url, len(self.data))
+        self.addCleanup(remote.close)
+
+        buffer = bytearray(100)
+        self.assertEqual(remote.readinto(buffer), 100)
+
+        # Skip a gap small enough to be read past on the open response
+        remote.seek(1000)
+        n = remote.readinto(buffer)
+
+        self.assertEqual(bytes(buffer[:n]), self.data[1000:1000 + n])
+        self.assertEqual(remote.tell(), 1000 + n)
+        self.assertEqual(self.server.requests, ['bytes=0-'])
+
+    def test_long_seek_makes_new_request(self):
+        remote = _HTTPRangeFile(self.api.session, self.url, len(self.data))
+        self.addCleanup(remote.close)
+
+        buffer = bytearray(100)
+        remote.readinto(buffer)
+
+        offset = len(self.data) - 50
+        remote.seek(offset)
+        n = remote.readinto(buffer)
+
+        self.assertEqual(bytes(buffer[:n]), self.data[offset:])
+        self.assertEqual(self.server.requests, ['bytes=0-', 'bytes=%s-' % offset])
+
+
+if __name__ == '__main__':
+    unittest.main()